@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 import argparse
-import json
-from icad_tone_detection import tone_detect
+import sys
 
 
 def main():
@@ -18,9 +17,15 @@ def main():
     parser.add_argument('-l', '--long_tone_min_length', type=float, default=3.8,
                         help='Min length of a long tone in seconds')
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('-j', '--json_format', choices=['auto', 'pretty', 'compact'], default='auto',
+                        help='JSON output format, auto is pretty on a terminal and compact otherwise')
 
     args = parser.parse_args()
 
+    # Imported after argument parsing so --help and usage errors don't pay for loading numpy and scipy
+    import json
+    from icad_tone_detection import tone_detect
+
     detect_result = tone_detect(
         audio_path=args.audio_path,
         matching_threshold=args.matching_threshold,
@@ -36,7 +41,12 @@ def main():
     data_dict = {"two_tone": detect_result.two_tone_result, "long_tone": detect_result.long_result,
                  "hl_tone": detect_result.hi_low_result}
 
-    print(json.dumps(data_dict))
+    pretty = args.json_format == 'pretty' or (args.json_format == 'auto' and sys.stdout.isatty())
+    if pretty:
+        json.dump(data_dict, sys.stdout, indent=2)
+    else:
+        json.dump(data_dict, sys.stdout, separators=(",", ":"))
+    sys.stdout.write("\n")
 
 
 main()
@@ -1,3 +1,3 @@
-from .main import tone_detect
+from .main import tone_detect, tone_detect_batch
 
-__all__ = ['tone_detect']
+__all__ = ['tone_detect', 'tone_detect_batch']
@@ -1,8 +1,24 @@
+import itertools
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from pydub import AudioSegment
-import requests
 from io import BytesIO, IOBase
 
+# Resolved once at import so decoding does not walk PATH on every call
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+# Frame rate all audio is converted to before frequency extraction
+TARGET_FRAME_RATE = 22050
+
+# Size of the chunks streamed between URL downloads, FFmpeg and this process
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Signed PCM sample types used by pydub for each sample width in bytes
+SAMPLE_WIDTH_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
 
 def load_audio(audio_input):
     """
@@ -23,23 +39,26 @@ def load_audio(audio_input):
     elif isinstance(audio_input, str):
         if audio_input.startswith('http://') or audio_input.startswith('https://'):
             audio = get_audio_from_url(audio_input)
-        else:
+        elif audio_input.lower().endswith('.wav'):
             audio = AudioSegment.from_file(audio_input)
-    elif isinstance(audio_input, IOBase) or isinstance(audio_input, bytes) or isinstance(audio_input, bytearray):
-        audio = AudioSegment.from_file(audio_input)
-    elif hasattr(audio_input, 'read'):
+        else:
+            audio = decode_audio_with_ffmpeg(audio_path=audio_input)
+    elif isinstance(audio_input, bytes) or isinstance(audio_input, bytearray):
+        audio = load_audio_from_file_object(BytesIO(audio_input))
+    elif isinstance(audio_input, IOBase) or hasattr(audio_input, 'read'):
         audio_input.seek(0)
-        audio = AudioSegment.from_file(BytesIO(audio_input.read()))
+        audio = load_audio_from_file_object(audio_input)
     else:
         raise ValueError("Unsupported audio input type. Must be a file path, URL, Bytes object, or Pydub AudioSegment.")
 
     # Processing
     try:
         audio = audio.set_channels(1)  # Ensure the audio is mono
-        audio = audio.set_frame_rate(22050)  # Set the frame rate to 22050 Hz
-        samples = np.array(audio.get_array_of_samples()).astype(np.float32)
-        max_val = float(2 ** (audio.sample_width * 8 - 1))
-        samples /= max_val
+        audio = audio.set_frame_rate(TARGET_FRAME_RATE)  # Set the frame rate to 22050 Hz
+        # View pydub's raw PCM buffer directly and scale to [-1, 1) in a single pass
+        raw = np.frombuffer(audio.raw_data, dtype=SAMPLE_WIDTH_DTYPES[audio.sample_width])
+        inv_max_val = np.float32(1.0 / float(1 << (audio.sample_width * 8 - 1)))
+        samples = np.multiply(raw, inv_max_val, dtype=np.float32)
     except Exception as e:
         raise RuntimeError(f"Error processing audio: {e}")
 
@@ -59,13 +78,130 @@ def get_audio_from_url(url):
     Raises:
     - ValueError if the audio cannot be fetched or loaded.
     """
+    # Imported here so loading local files does not pay for importing requests and urllib3
+    import requests
+
     try:
-        response = requests.get(url)
-        # Check if the request was successful
-        response.raise_for_status()
-        audio = AudioSegment.from_file(BytesIO(response.content))
+        with requests.get(url, stream=True, timeout=30) as response:
+            # Check if the request was successful
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            first_chunk = next(chunks, b"")
+            if is_wav_header(first_chunk):
+                audio = AudioSegment.from_file(BytesIO(first_chunk + b"".join(chunks)), format="wav")
+            else:
+                # Decode while downloading instead of buffering the whole response first
+                audio = decode_audio_with_ffmpeg(audio_chunks=itertools.chain([first_chunk], chunks))
         return audio
     except requests.exceptions.RequestException as e:
         raise ValueError(f"Failed to fetch audio from URL: {e}")
     except Exception as e:
         raise ValueError(f"Failed to load audio from the fetched content: {e}")
+
+
+def load_audio_from_file_object(file_object):
+    """
+    Loads audio from a file-like object. WAV data is parsed directly by pydub, anything else is piped to FFmpeg.
+
+    Parameters:
+    - file_object: A seekable file-like object positioned at the start of the audio data.
+
+    Returns:
+    - An AudioSegment object of the audio data.
+    """
+    header = file_object.read(12)
+    file_object.seek(0)
+    if is_wav_header(header):
+        return AudioSegment.from_file(file_object, format="wav")
+    return decode_audio_with_ffmpeg(audio_bytes=file_object.read())
+
+
+def is_wav_header(data):
+    """
+    Checks whether data starts with a RIFF/WAVE header.
+    """
+    return data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def decode_audio_with_ffmpeg(audio_path=None, audio_bytes=None, audio_chunks=None):
+    """
+    Decodes audio to mono 16 bit PCM at the target frame rate with a single FFmpeg process, instead of pydub's
+    ffprobe call followed by a separate FFmpeg conversion.
+
+    Parameters:
+    - audio_path: str, path of a file for FFmpeg to read directly.
+    - audio_bytes: bytes, encoded audio piped to FFmpeg when no path is given.
+    - audio_chunks: iterable of bytes, encoded audio streamed to FFmpeg as it is produced.
+
+    Returns:
+    - An AudioSegment of the decoded audio.
+
+    Raises:
+    - ValueError if FFmpeg is not available or fails to decode the audio.
+    """
+    if FFMPEG_PATH is None:
+        raise ValueError("FFmpeg is required to decode non-WAV audio but was not found on PATH.")
+
+    command = [FFMPEG_PATH, "-hide_banner", "-loglevel", "error"]
+    if audio_path is not None:
+        command += ["-nostdin", "-i", audio_path]
+    else:
+        command += ["-i", "pipe:0"]
+    command += ["-vn", "-ac", "1", "-ar", str(TARGET_FRAME_RATE), "-acodec", "pcm_s16le", "-f", "s16le", "pipe:1"]
+
+    if audio_bytes is not None:
+        audio_chunks = [audio_bytes]
+    returncode, output, errors = run_ffmpeg(command, audio_chunks)
+
+    if returncode != 0 or not output:
+        raise ValueError(f"FFmpeg failed to decode audio: {errors.decode(errors='replace').strip()}")
+
+    return AudioSegment(data=output, sample_width=2, frame_rate=TARGET_FRAME_RATE, channels=1)
+
+
+def run_ffmpeg(command, audio_chunks=None):
+    """
+    Runs FFmpeg, optionally feeding its stdin from an iterable of byte chunks. Writing stdin and reading stderr happen
+    on worker threads while this thread collects stdout chunk by chunk into a single buffer, so no side of the pipe
+    can block the others and the input is never copied into an intermediate buffer.
+
+    Parameters:
+    - command: list, the FFmpeg command. It must read from pipe:0 when audio_chunks is given.
+    - audio_chunks: iterable of bytes written to FFmpeg's stdin, or None if FFmpeg reads its input itself.
+
+    Returns:
+    - Tuple of (return code, stdout bytearray, stderr bytes).
+
+    Raises:
+    - Any exception raised while producing the chunks, e.g. a dropped download.
+    """
+    stdin = subprocess.PIPE if audio_chunks is not None else subprocess.DEVNULL
+    process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        feeding = executor.submit(write_chunks, process.stdin, audio_chunks) if audio_chunks is not None else None
+        errors = executor.submit(process.stderr.read)
+
+        output = bytearray()
+        while chunk := process.stdout.read(STREAM_CHUNK_SIZE):
+            output += chunk
+
+        returncode = process.wait()
+        if feeding is not None:
+            feeding.result()
+        return returncode, output, errors.result()
+
+
+def write_chunks(pipe, audio_chunks):
+    """
+    Writes byte chunks to a pipe and closes it. Stops early if the reader has exited.
+    """
+    try:
+        for chunk in audio_chunks:
+            pipe.write(chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
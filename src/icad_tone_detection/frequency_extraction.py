@@ -1,5 +1,116 @@
-from scipy.signal import stft
+import functools
+from typing import NamedTuple
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft
+from scipy.signal import get_window
+
+from .jit import NUMBA_AVAILABLE, njit, prange
+
+try:
+    import pyfftw.interfaces.cache
+    import pyfftw.interfaces.scipy_fft
+
+    FFT_BACKEND = pyfftw.interfaces.scipy_fft
+except ImportError:
+    FFT_BACKEND = 'scipy'
+
+# Number of STFT frames transformed and reduced at a time. A tile of 2048 point frames is about 1 MiB of complex64,
+# small enough to stay in cache between the FFT and the peak picking
+STFT_TILE_FRAMES = 128
+
+# Peak bin reported for frames with no power inside the peak-pick band. Bin 0 is 0 Hz, which the detectors treat as
+# no tone, so silence is never mistaken for a tone at the bottom of the band
+SILENT_BIN = 0
+
+
+@functools.lru_cache(maxsize=None)
+def _enable_fftw_cache():
+    """
+    Turns on pyFFTW's interface cache so FFTW plans are kept alive between tone_detect calls and planning is not
+    repeated. Called on the first STFT rather than at import. The cache is process wide, so it also applies to any
+    other pyfftw.interfaces use in the same process.
+    """
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60.0)
+
+
+@functools.lru_cache(maxsize=8)
+def _hann_window(n_fft, dtype):
+    """
+    Returns a read-only periodic Hann window, cached per FFT size and dtype.
+    """
+    window = get_window('hann', n_fft).astype(dtype)
+    window.flags.writeable = False
+    return window
+
+
+@functools.lru_cache(maxsize=8)
+def _rfft_frequencies(n_fft, frame_rate):
+    """
+    Returns the read-only bin frequencies of a one-sided FFT, cached per FFT size and frame rate.
+    """
+    frequencies = fft.rfftfreq(n_fft, 1 / frame_rate)
+    frequencies.flags.writeable = False
+    return frequencies
+
+
+class MatchGroup(NamedTuple):
+    """
+    A run of consecutive STFT frames with matching frequencies. Being a tuple it still unpacks as
+    (start, end, length, freqs).
+    """
+    start: float  # Time of the first frame in seconds
+    end: float  # Time of the last frame in seconds
+    length: float  # end - start in seconds
+    freqs: np.ndarray  # Peak frequency of every frame in the group, rounded to 0.1 Hz
+
+
+@njit(parallel=True, cache=True)
+def _peak_bins_nb(zxx, low_bin, high_bin):
+    """
+    Returns the index of the highest power bin in [low_bin, high_bin) for every frame of the (frames, bins) STFT, or
+    SILENT_BIN for frames with no power in the band. The power is computed bin by bin, so no power spectrogram is
+    allocated.
+    """
+    peak_bins = np.empty(zxx.shape[0], dtype=np.int64)
+    for frame in prange(zxx.shape[0]):
+        best_bin = SILENT_BIN
+        best_power = 0.0
+        for b in range(low_bin, high_bin):
+            value = zxx[frame, b]
+            power = value.real * value.real + value.imag * value.imag
+            if power > best_power:
+                best_power = power
+                best_bin = b
+        peak_bins[frame] = best_bin
+    return peak_bins
+
+
+@njit(cache=True)
+def _group_bounds_nb(frequencies, matching_threshold):
+    """
+    Scans the per-frame frequencies once and returns the start and exclusive end frame of every group of at least
+    two matching frames.
+    """
+    count = frequencies.shape[0]
+    group_starts = np.empty(count // 2 + 1, dtype=np.int64)
+    group_ends = np.empty(count // 2 + 1, dtype=np.int64)
+    found = 0
+    start = 0
+
+    # One extra step past the last frame closes the final group
+    for i in range(1, count + 1):
+        if i < count and abs(frequencies[i] - frequencies[i - 1]) <= frequencies[i - 1] * matching_threshold / 100:
+            continue
+        if i - start >= 2:
+            group_starts[found] = start
+            group_ends[found] = i
+            found += 1
+        start = i
+
+    return group_starts[:found], group_ends[:found]
 
 
 class FrequencyExtraction:
@@ -7,58 +118,76 @@ class FrequencyExtraction:
         A class for extracting frequencies from audio samples using Short-Time Fourier Transform (STFT).
 
         Attributes:
-            samples (np.array): The audio samples.
+            samples (np.array): The audio samples as float32.
             frame_rate (int): The sampling rate of the audio.
             duration_seconds (float): The duration of the audio in seconds.
             matching_threshold (float): The percentage threshold used to determine if two frequencies
                 are considered a match. For example, a threshold of 2 means that two frequencies are considered matching
                 if they are within 2% of each other.
             time_resolution_ms (int): The time resolution in milliseconds for the STFT. Default is 100ms.
+            frequency_band (tuple): Optional (low, high) range in Hz the peak frequency is picked from.
+            n_fft (int): The number of FFT points per frame.
+            hop_length (int): The number of samples between successive STFT frames.
+            frequencies (np.array): The frequency of every FFT bin.
+            low_bin (int): The first FFT bin inside frequency_band.
+            high_bin (int): One past the last FFT bin inside frequency_band.
     """
 
-    def __init__(self, samples, frame_rate, duration_seconds, matching_threshold, time_resolution_ms):
+    def __init__(self, samples, frame_rate, duration_seconds, matching_threshold, time_resolution_ms,
+                 frequency_band=None, n_fft=2048):
         """
         Initializes the FrequencyExtraction class with audio data.
 
          Parameters:
-            - samples (np.array): The audio samples.
+            - samples (np.array): The audio samples. They are converted once to a contiguous float32 array, so the
+               STFT runs in single precision (complex64), which is plenty for peak picking and halves the memory
+               traffic. float32 contiguous input, like that from load_audio, is used without a copy.
             - frame_rate (int): The sampling rate of the audio.
             - duration_seconds (float): The duration of the audio in seconds.
             - matching_threshold (float): The percentage threshold used to determine if two frequencies
                are considered a match.
             - time_resolution_ms (int): The time resolution in milliseconds for the STFT. Default is 100ms.
+            - frequency_band (tuple): Optional (low, high) range in Hz, inclusive, that the peak frequency of each
+               frame is picked from. Bins outside the band are never examined. Default None uses the whole spectrum.
+               A band that holds no FFT bin raises ValueError.
+            - n_fft (int): The number of FFT points per frame. None picks the smallest power of two covering two hops,
+               between 256 and 2048, which makes the FFT cheaper at fine time resolutions but coarsens the frequency
+               bins (frame_rate / n_fft Hz apart). Default 2048.
          """
-        self.samples = samples
+        self.samples = np.ascontiguousarray(samples, dtype=np.float32)
         self.frame_rate = frame_rate
         self.duration_seconds = duration_seconds
         self.time_resolution_ms = time_resolution_ms
         self.matching_threshold = matching_threshold
+        self.frequency_band = frequency_band
+
+        # The frame layout and peak-pick bins depend only on the settings, so they are worked out once here
+        self.hop_length = self.hop_size(frame_rate, time_resolution_ms)
+        self.n_fft = n_fft if n_fft is not None else self.auto_fft_size(self.hop_length)
+        self.frequencies = _rfft_frequencies(self.n_fft, frame_rate)
+        self.low_bin, self.high_bin = self.band_bins(self.frequencies)
 
     def get_audio_frequencies(self):
         """
         Extracts frequencies from the audio data using STFT.
 
         Returns:
-            list: A list of tuples, each containing the start time and a list of matching frequencies, or None if an error occurs.
+            list: A list of MatchGroup tuples, each containing the start time and the matching frequencies, or None if
+                an error occurs.
         """
         try:
-            window = 'hann'
-            n_fft = 2048  # Number of FFT points, smaller values may be considered if finer time resolution is needed
+            if not np.any(self.samples):
+                # Silent audio: every frame's power is zero, so every frame reads as 0 Hz, no tone
+                time_samples = self.frame_times(self.n_fft, self.hop_length)
+                return self.match_frequencies(np.zeros(len(time_samples)), time_samples)
 
-            # Calculate hop_length based on the desired time resolution
-            hop_length = max(1, int(self.frame_rate * self.time_resolution_ms / 1000))
+            # Detect the frequency with the highest power at each time step inside the peak-pick band. Decibels and
+            # magnitude are monotonic in power so the argmax is taken on the squared magnitude directly.
+            peak_bins = self.stft_peak_bins(self.n_fft, self.hop_length, self.low_bin, self.high_bin)
+            detected_frequencies = self.frequencies[peak_bins]
+            time_samples = self.frame_times(self.n_fft, self.hop_length)
 
-            # Perform the STFT
-            frequencies, time_samples, zxx = stft(self.samples, self.frame_rate, window=window, nperseg=n_fft, noverlap=n_fft - hop_length)
-            amplitude = np.abs(zxx)  # Get the magnitude of the STFT coefficients
-
-            # Convert amplitude to decibels
-            amplitude_db = self.amplitude_to_decibels(amplitude, np.max(amplitude))
-
-            # Detect the frequency with the highest amplitude at each time step
-            detected_frequencies = frequencies[np.argmax(amplitude_db, axis=0)]
-
-            matching_frequencies = self.match_frequencies(detected_frequencies.tolist(), time_samples)
+            matching_frequencies = self.match_frequencies(detected_frequencies, time_samples)
 
             return matching_frequencies
 
@@ -66,6 +195,107 @@ class FrequencyExtraction:
             print(f"Error extracting frequencies: {e}")
             return None
 
+    def stft_peak_bins(self, n_fft, hop_length, low_bin, high_bin):
+        """
+        Computes the STFT tile by tile and returns the highest power bin in [low_bin, high_bin) of every frame.
+        Each tile of STFT_TILE_FRAMES frames is windowed, transformed and reduced to its peaks while it is still in
+        cache, so the full spectrogram is never held in memory.
+
+        Parameters:
+            n_fft (int): The number of FFT points per frame.
+            hop_length (int): The number of samples between successive frames.
+            low_bin (int): The first bin peaks are picked from.
+            high_bin (int): One past the last bin peaks are picked from.
+
+        Returns:
+            np.array: The peak bin index of every frame.
+        """
+        frames = self.frames(n_fft, hop_length)
+        window = _hann_window(n_fft, frames.dtype)
+        peak_bins = np.empty(frames.shape[0], dtype=np.int64)
+
+        if FFT_BACKEND != 'scipy':
+            _enable_fftw_cache()
+        # Only the STFT uses the pyFFTW backend, scipy.fft's global backend is left untouched
+        with fft.set_backend(FFT_BACKEND):
+            for start in range(0, frames.shape[0], STFT_TILE_FRAMES):
+                tile = slice(start, start + STFT_TILE_FRAMES)
+                zxx = fft.rfft(frames[tile] * window, axis=-1, workers=-1)
+                peak_bins[tile] = self.peak_bins(zxx, low_bin, high_bin)
+        return peak_bins
+
+    def frames(self, n_fft, hop_length):
+        """
+        Returns the zero padded samples as overlapping frames, one frame per row. Framing matches scipy.signal.stft:
+        the signal is padded by n_fft // 2 on both sides and at the end to a whole number of hops. The frames are a
+        zero-copy view of a single padded buffer.
+        """
+        boundary = n_fft // 2
+        padded = np.zeros(self.padded_length(n_fft, hop_length), dtype=np.float32)
+        padded[boundary:boundary + len(self.samples)] = self.samples
+        return sliding_window_view(padded, n_fft)[::hop_length]
+
+    def padded_length(self, n_fft, hop_length):
+        """
+        Returns the length of the samples after the STFT zero padding: n_fft // 2 on both sides, then up to a whole
+        number of hops.
+        """
+        padded_length = len(self.samples) + 2 * (n_fft // 2)
+        return padded_length + (-(padded_length - n_fft) % hop_length) % n_fft
+
+    def frame_times(self, n_fft, hop_length):
+        """
+        Returns the time in seconds of each STFT frame.
+        """
+        frame_count = (self.padded_length(n_fft, hop_length) - n_fft) // hop_length + 1
+        return np.arange(frame_count) * hop_length / self.frame_rate
+
+    @staticmethod
+    def hop_size(frame_rate, time_resolution_ms):
+        """
+        Returns the number of samples between successive STFT frames for the given time resolution, at least one.
+        """
+        return max(1, int(frame_rate * time_resolution_ms / 1000))
+
+    @staticmethod
+    def auto_fft_size(hop_length):
+        """
+        Returns the number of FFT points used when n_fft is None: the smallest power of two of at least two hops,
+        clamped to [256, 2048].
+        """
+        return min(2048, 1 << max(8, (2 * hop_length - 1).bit_length()))
+
+    def peak_bins(self, zxx, low_bin, high_bin):
+        """
+        Returns the index of the highest power bin in [low_bin, high_bin) for each frame of the STFT, or SILENT_BIN for
+        frames with no power in the band. With numba the power and argmax are fused into one parallel pass over the
+        frames. Otherwise the power spectrogram of the band is built with NumPy.
+        """
+        if NUMBA_AVAILABLE:
+            return _peak_bins_nb(zxx, low_bin, high_bin)
+
+        # Slicing the bin axis is a view, no copy is made
+        zxx = zxx[:, low_bin:high_bin]
+        power = np.square(zxx.real)
+        power += np.square(zxx.imag)
+        peak_bins = np.argmax(power, axis=1)
+        silent = np.take_along_axis(power, peak_bins[:, np.newaxis], axis=1)[:, 0] == 0
+        return np.where(silent, SILENT_BIN, low_bin + peak_bins)
+
+    def band_bins(self, frequencies):
+        """
+        Returns the (low, high) slice bounds of the frequency bins inside frequency_band, or the whole spectrum if no
+        band was given.
+        """
+        if self.frequency_band is None:
+            return 0, len(frequencies)
+        low, high = self.frequency_band
+        low_bin = int(np.searchsorted(frequencies, low, side='left'))
+        high_bin = int(np.searchsorted(frequencies, high, side='right'))
+        if low_bin >= high_bin:
+            raise ValueError(f"Frequency band {self.frequency_band} contains no FFT bins.")
+        return low_bin, high_bin
+
     def dynamic_threshold(self, frequencies, index):
         """
         Calculates a dynamic threshold based on the frequency changes.
@@ -75,16 +305,19 @@ class FrequencyExtraction:
 
     def calculate_times(self, start_index, end_index, time_samples):
         """
-        Calculates accurate start and end times for frequency matches.
+        Calculates accurate start and end times for frequency matches. The indexes may be arrays, in which case the
+        times of all matches are computed at once.
         """
-        start_time = round(time_samples[start_index], 3)
-        end_time = round(time_samples[end_index], 3)  # Use end_index directly
+        time_samples = np.asarray(time_samples)
+        start_time = np.round(time_samples[start_index], 3)
+        end_time = np.round(time_samples[end_index], 3)  # Use end_index directly
         return start_time, end_time
 
     @staticmethod
     def amplitude_to_decibels(amplitude, reference_value):
         """
-        Converts amplitude to decibels relative to a reference value.
+        Converts amplitude to decibels relative to a reference value. Not needed for peak picking, which works on
+        the power directly.
 
         Parameters:
             amplitude (np.array): The amplitude of the frequencies.
@@ -97,46 +330,87 @@ class FrequencyExtraction:
         reference_value = np.maximum(reference_value, 1e-20)
         return 20 * np.log10(np.maximum(amplitude, 1e-20) / reference_value)
 
+    def group_bounds(self, frequencies):
+        """
+        Splits the per-frame frequencies into groups of matching frequencies. A frame continues the current group
+        when it is within matching_threshold percent of the previous frame, every other frame starts a new group.
+
+        Parameters:
+            frequencies (np.array): The rounded peak frequency of every frame, at least one frame long.
+
+        Returns:
+            tuple: (group_starts, group_ends) frame index arrays of the groups that span at least two frames, with
+                exclusive ends.
+        """
+        if NUMBA_AVAILABLE:
+            return _group_bounds_nb(frequencies, self.matching_threshold)
+
+        thresholds = frequencies[:-1] * self.matching_threshold / 100
+        breaks = np.flatnonzero(~(np.abs(np.diff(frequencies)) <= thresholds)) + 1
+        group_starts = np.concatenate(([0], breaks))
+        group_ends = np.concatenate((breaks, [frequencies.size]))
+
+        # Only groups of at least two frames are kept
+        keep = group_ends - group_starts >= 2
+        return group_starts[keep], group_ends[keep]
+
     def match_frequencies(self, detected_frequencies, time_samples):
         """
         Identifies and groups matching frequencies from a list of detected frequencies based on the matching threshold.
         Each group's start time, end time, and the matching frequencies are returned.
 
         Parameters:
-            detected_frequencies (list of float): The detected frequencies from the audio sample.
+            detected_frequencies (np.array): The detected frequencies from the audio sample, one per frame.
             time_samples (np.array): Array of times corresponding to each frequency sample.
 
         Returns:
-            list of tuples: Each tuple contains the start time, end time, and a list of matching frequencies.
+            list of MatchGroup: Each group contains the start time, end time, length and an array of the matching
+                frequencies. The arrays are views into one array of all frames, so no per-frame floats are created.
         """
 
-        if not detected_frequencies:
+        frequencies = np.round(np.asarray(detected_frequencies, dtype=np.float64), 1)
+        if frequencies.size == 0:
             return []
 
         try:
-            frequencies = [round(f, 1) for f in detected_frequencies]
-            matching_frequencies = []
-            current_match = [frequencies[0]]
-            start_index = 0
-
-            for i in range(1, len(frequencies)):
-                threshold = self.dynamic_threshold(frequencies, i)
-                if abs(frequencies[i] - frequencies[i - 1]) <= threshold:
-                    current_match.append(frequencies[i])
-                else:
-                    if len(current_match) >= 2:
-                        start_time, end_time = self.calculate_times(start_index, i - 1, time_samples)
-                        freq_length = round(end_time - start_time, 3)
-                        matching_frequencies.append((start_time, end_time, freq_length, current_match))
-                    current_match = [frequencies[i]]
-                    start_index = i
-
-            if len(current_match) >= 2:
-                start_time, end_time = self.calculate_times(start_index, len(frequencies) - 1, time_samples)
-                freq_length = round(end_time - start_time, 3)
-                matching_frequencies.append((start_time, end_time, freq_length, current_match))
+            group_starts, group_ends = self.group_bounds(frequencies)
 
-            return matching_frequencies
+            start_times, end_times = self.calculate_times(group_starts, group_ends - 1, time_samples)
+            freq_lengths = np.round(end_times - start_times, 3)
+
+            return [MatchGroup(start_time, end_time, freq_length, frequencies[start:end])
+                    for start_time, end_time, freq_length, start, end
+                    in zip(start_times, end_times, freq_lengths, group_starts, group_ends)]
         except Exception as e:
             print(f"Error matching frequencies: {e}")
-            return []
\ No newline at end of file
+            return []
+
+
+def frequency_matches_to_arrays(frequency_matches):
+    """
+    Converts the list of matched frequency groups into parallel arrays (Struct-of-Arrays) for the detection kernels.
+
+    Parameters:
+        frequency_matches (list of tuples): Each tuple contains the start time, end time, length and the matching
+            frequencies, as returned by FrequencyExtraction.match_frequencies.
+
+    Returns:
+        tuple: (starts, ends, lengths, first_freqs, has_zero, group_lens) with one entry per group. has_zero is a
+            boolean array flagging groups that contain a 0 Hz frequency, group_lens is int32 and the rest are float64.
+    """
+    count = len(frequency_matches)
+    starts = np.fromiter((g[0] for g in frequency_matches), dtype=np.float64, count=count)
+    ends = np.fromiter((g[1] for g in frequency_matches), dtype=np.float64, count=count)
+    lengths = np.fromiter((g[2] for g in frequency_matches), dtype=np.float64, count=count)
+    group_lens = np.fromiter((len(g[3]) for g in frequency_matches), dtype=np.int32, count=count)
+
+    # Look at the frequencies of all groups in one flat array instead of group by group
+    first_freqs = np.zeros(count, dtype=np.float64)
+    has_zero = np.zeros(count, dtype=np.bool_)
+    non_empty = np.flatnonzero(group_lens)
+    if non_empty.size:
+        flat = np.concatenate([np.asarray(frequency_matches[i][3], dtype=np.float64) for i in non_empty])
+        offsets = np.cumsum(group_lens[non_empty]) - group_lens[non_empty]
+        first_freqs[non_empty] = flat[offsets]
+        has_zero[non_empty] = np.logical_or.reduceat(flat == 0, offsets)
+    return starts, ends, lengths, first_freqs, has_zero, group_lens
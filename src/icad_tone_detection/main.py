@@ -1,17 +1,61 @@
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 from .audio_loader import load_audio
-from .frequency_extraction import FrequencyExtraction
+from .frequency_extraction import FrequencyExtraction, frequency_matches_to_arrays
 from .tone_detection import detect_two_tone, detect_long_tones, detect_warble_tones
 
+# Number of matched groups printed from the start and the end of the audio in debug mode
+DEBUG_HEAD_GROUPS = 20
+DEBUG_TAIL_GROUPS = 5
+
+# Settings and matched groups printed by tone_detect in debug mode, filled from its local variables
+DEBUG_TEMPLATE = (
+    "Analyzing {audio_path} with the following settings:\n"
+    "Matching Threshold: {matching_threshold}%\n"
+    "Time Resolution: {time_resolution_ms}ms\n"
+    "Tone A Min Length: {tone_a_min_length}s\n"
+    "Tone B Min Length: {tone_b_min_length}s\n"
+    "Long Tone Min Length: {long_tone_min_length}s\n"
+    "Hi-Low Interval: {hi_low_interval}s\n"
+    "Hi-Low Min Alternations: {hi_low_min_alternations}\n"
+    "Matched frequencies ({group_count} groups):\n{matched_lines}"
+)
+
 
 class ToneDetectionResult:
+    # Fixed fields, so instances skip the per-object __dict__
+    __slots__ = ("two_tone_result", "long_result", "hi_low_result")
+
     def __init__(self, two_tone_result, long_result, hi_low_result):
         self.two_tone_result = two_tone_result
         self.long_result = long_result
         self.hi_low_result = hi_low_result
 
 
+def format_matched_groups(matched_groups):
+    """
+    Formats matched groups for the debug output, one line per group. Long recordings only show the first
+    DEBUG_HEAD_GROUPS and last DEBUG_TAIL_GROUPS groups, so the frequencies of every group are never stringified.
+    """
+    def group_line(group):
+        start, end, length, freqs = group
+        return f"  {start}s - {end}s ({length}s): {', '.join(map(str, freqs.tolist()))}"
+
+    hidden = len(matched_groups) - DEBUG_HEAD_GROUPS - DEBUG_TAIL_GROUPS
+    if hidden <= 0:
+        return "\n".join(map(group_line, matched_groups))
+    return "\n".join(itertools.chain(
+        map(group_line, matched_groups[:DEBUG_HEAD_GROUPS]),
+        [f"  ... {hidden} more groups ..."],
+        map(group_line, matched_groups[-DEBUG_TAIL_GROUPS:])))
+
+
 def tone_detect(audio_path, matching_threshold=2.5, time_resolution_ms=25, tone_a_min_length=0.7, tone_b_min_length=2.7, hi_low_interval=0.2,
-                hi_low_min_alternations=6, long_tone_min_length=3.8, debug=False):
+                hi_low_min_alternations=6, long_tone_min_length=3.8, debug=False,
+                frequency_band=None, n_fft=2048):
     """
         Loads audio from various sources including local path, URL, BytesIO object, or a PyDub AudioSegment.
 
@@ -26,7 +70,14 @@ def tone_detect(audio_path, matching_threshold=2.5, time_resolution_ms=25, tone_
            - long_tone_min_length (float): The minimum length a long tone needs to be to consider it a match. Default 3.8 Seconds
            - hi_low_interval (float): The maximum allowed interval in seconds between two consecutive alternating tones. Default is 0.2 Seconds
            - hi_low_min_alternations (int): The minimum number of alternations for a hi-low warble tone sequence to be considered valid. Default 6
-           - debug (bool): If debug is enabled, print all tones found in audio file. Default is False
+           - debug (bool): If debug is enabled, print the settings and the matched frequency groups found in the audio
+                file. Only the first DEBUG_HEAD_GROUPS (20) and last DEBUG_TAIL_GROUPS (5) groups are printed, with a
+                count of the groups skipped in between. Default is False
+           - frequency_band (tuple): Optional (low, high) range in Hz the peak frequency of each STFT frame is picked
+                from, e.g. (200, 3000) to ignore hum and hiss outside the tone range. Default None uses the whole
+                spectrum.
+           - n_fft (int): The number of FFT points per STFT frame. None sizes it from time_resolution_ms (two hops,
+                256 to 2048 points), trading frequency resolution for speed at fine time resolutions. Default 2048.
 
         Returns:
            - An instance of ToneDetectionResult containing information about the found tones in the audio.
@@ -37,23 +88,57 @@ def tone_detect(audio_path, matching_threshold=2.5, time_resolution_ms=25, tone_
 
     samples, frame_rate, duration_seconds = load_audio(audio_path)
 
+    # Skip the STFT entirely when the audio is too short to hold any tone. STFT frames can extend up to one hop past
+    # the end of the audio, and a hi-low sequence needs at least two frames per alternation.
+    frame_seconds = FrequencyExtraction.hop_size(frame_rate, time_resolution_ms) / frame_rate
+    shortest_tone = min(tone_a_min_length + tone_b_min_length, long_tone_min_length,
+                        (2 * hi_low_min_alternations - 1) * frame_seconds)
+    if duration_seconds + frame_seconds < shortest_tone:
+        if debug is True:
+            print(f"Skipping {audio_path}: {duration_seconds}s of audio is shorter than the shortest detectable "
+                  f"tone ({shortest_tone}s)")
+        return ToneDetectionResult([], [], [])
+
     matched_frequencies = FrequencyExtraction(samples, frame_rate, duration_seconds, matching_threshold,
-                                              time_resolution_ms).get_audio_frequencies()
+                                              time_resolution_ms, frequency_band,
+                                              n_fft).get_audio_frequencies()
+    # The detectors only need the matched groups, so release the decoded audio before running them
+    del samples
     if debug is True:
-        debug_info = (
-            f"Analyzing {audio_path} with the following settings:\n"
-            f"Matching Threshold: {matching_threshold}%\n"
-            f"Time Resolution: {time_resolution_ms}ms\n"
-            f"Tone A Min Length: {tone_a_min_length}s\n"
-            f"Tone B Min Length: {tone_b_min_length}s\n"
-            f"Long Tone Min Length: {long_tone_min_length}s\n"
-            f"Hi-Low Interval: {hi_low_interval}s\n"
-            f"Hi-Low Min Alternations: {hi_low_min_alternations}\n"
-            f"Matched frequencies: {matched_frequencies}"
-        )
-        print(debug_info)
-
-    two_tone_result = detect_two_tone(matched_frequencies, tone_a_min_length, tone_b_min_length)
-    long_result = detect_long_tones(matched_frequencies, two_tone_result, long_tone_min_length)
-    hi_low_result = detect_warble_tones(matched_frequencies, hi_low_interval, hi_low_min_alternations)
+        matched_groups = matched_frequencies or []
+        group_count = len(matched_groups)
+        matched_lines = format_matched_groups(matched_groups)
+        print(DEBUG_TEMPLATE.format_map(locals()))
+
+    # Build the per-group arrays once and share them between the detectors
+    group_arrays = frequency_matches_to_arrays(matched_frequencies or [])
+    two_tone_result = detect_two_tone(matched_frequencies, tone_a_min_length, tone_b_min_length,
+                                      group_arrays=group_arrays)
+    long_result = detect_long_tones(matched_frequencies, two_tone_result, long_tone_min_length,
+                                    group_arrays=group_arrays)
+    hi_low_result = detect_warble_tones(matched_frequencies, hi_low_interval, hi_low_min_alternations,
+                                        group_arrays=group_arrays)
     return ToneDetectionResult(two_tone_result, long_result, hi_low_result)
+
+
+def tone_detect_batch(audio_paths, max_workers=None, **kwargs):
+    """
+        Runs tone_detect on many audio sources in parallel, one worker process per CPU core by default.
+
+        Parameters:
+           - audio_paths: Iterable of audio sources accepted by tone_detect. Each must be picklable, so use paths,
+                URLs or bytes rather than open file objects.
+           - max_workers (int): The number of worker processes. Default is the number of CPUs. Workers are started
+                with the spawn method, so call this from under an if __name__ == "__main__": guard in scripts.
+           - kwargs: Detection settings passed to every tone_detect call, e.g. matching_threshold.
+
+        Returns:
+           - A list of ToneDetectionResult instances in the same order as audio_paths.
+
+        Raises:
+            - The first exception raised by tone_detect for any of the audio sources.
+        """
+    # Workers are spawned rather than forked: forking after numba's parallel kernels have started their thread pool
+    # deadlocks the children. Spawned workers re-import the calling module, so scripts need a __main__ guard.
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(partial(tone_detect, **kwargs), audio_paths))
@@ -1,64 +1,122 @@
-def detect_two_tone(frequency_matches, min_tone_a_length=0.7, min_tone_b_length=2.7):
+import numpy as np
+
+from .frequency_extraction import frequency_matches_to_arrays
+from .jit import njit
+
+
+@njit(cache=True)
+def _detect_two_tone_nb(starts, ends, candidates, min_tone_a_length, min_tone_b_length):
+    """
+    Scans the candidate groups for an A tone followed by a B tone. Returns the A and B group indices of each match.
+    """
+    count = candidates.shape[0]
+    a_indexes = np.empty(count, dtype=np.int64)
+    b_indexes = np.empty(count, dtype=np.int64)
+    found = 0
+    last_index = -1
+
+    for i in candidates:
+        if last_index >= 0:
+            last_duration = ends[last_index] - starts[last_index]
+            current_duration = ends[i] - starts[i]
+            # Check if the last tone is a valid A tone and the current is a valid B tone
+            if last_duration >= min_tone_a_length and current_duration >= min_tone_b_length:
+                a_indexes[found] = last_index
+                b_indexes[found] = i
+                found += 1
+        last_index = i
+
+    return a_indexes[:found], b_indexes[:found]
+
+
+def detect_two_tone(frequency_matches, min_tone_a_length=0.7, min_tone_b_length=2.7, group_arrays=None):
     two_tone_matches = []
-    tone_id = 0
-    last_set = None
-    if not frequency_matches or len(frequency_matches) < 1:
+    if not frequency_matches:
         return two_tone_matches
 
-    for current_set in frequency_matches:
-        if all(f > 0 for f in current_set[3]):  # Ensure frequencies are non-zero
-            current_duration = current_set[1] - current_set[0]  # Calculate the duration of the current tone
-
-            if last_set is None:
-                last_set = current_set
-            else:
-                last_duration = last_set[1] - last_set[0]  # Calculate the duration of the last tone
-                # Check if the last tone is a valid A tone and the current is a valid B tone
-                if last_duration >= min_tone_a_length and current_duration >= min_tone_b_length:
-                    tone_data = {
-                        "tone_id": f'qc_{tone_id + 1}',
-                        "detected": [last_set[3][0], current_set[3][0]],  # Frequency values of A and B tones
-                        "tone_a_length": last_set[2],
-                        "tone_b_length": current_set[2],
-                        "start": last_set[0],  # Start time of tone A
-                        "end": current_set[1]  # End time of tone B
-                    }
-                    tone_id += 1
-                    two_tone_matches.append(tone_data)
-                # Update last_set to current_set for next iteration
-                last_set = current_set
+    if group_arrays is None:
+        group_arrays = frequency_matches_to_arrays(frequency_matches)
+    starts, ends, _, _, has_zero, _ = group_arrays
+
+    # Only groups whose frequencies are all non-zero can be A or B tones
+    candidates = np.flatnonzero(~has_zero)
+    a_indexes, b_indexes = _detect_two_tone_nb(starts, ends, candidates, min_tone_a_length, min_tone_b_length)
+
+    for tone_id, (a_index, b_index) in enumerate(zip(a_indexes.tolist(), b_indexes.tolist())):
+        last_set = frequency_matches[a_index]
+        current_set = frequency_matches[b_index]
+        two_tone_matches.append({
+            "tone_id": f'qc_{tone_id + 1}',
+            "detected": [float(last_set[3][0]), float(current_set[3][0])],  # Frequency values of A and B tones
+            "tone_a_length": last_set[2],
+            "tone_b_length": current_set[2],
+            "start": last_set[0],  # Start time of tone A
+            "end": current_set[1]  # End time of tone B
+        })
 
     return two_tone_matches
 
 
-def detect_long_tones(frequency_matches, detected_quickcall, min_duration=2.0):
-    long_tone_matches = []
-    excluded_frequencies = set([0.0])  # Initializing with 0.0 Hz to exclude it
+@njit(cache=True)
+def _is_excluded(frequency, excluded_frequencies, tolerance):
+    """
+    Checks if a frequency is within the tolerance of any of the sorted excluded frequencies. Only the two
+    neighbours around the insertion point can be the closest, so at most two comparisons are made.
+    """
+    position = np.searchsorted(excluded_frequencies, frequency)
+    for j in (position - 1, position):
+        if 0 <= j < excluded_frequencies.shape[0] and abs(excluded_frequencies[j] - frequency) / frequency <= tolerance:
+            return True
+    return False
 
-    # Add detected quick call tones to the excluded list
-    for quickcall in detected_quickcall:
-        excluded_frequencies.update(quickcall["detected"][:2])
 
-    for start, end, duration, frequencies in frequency_matches:
-        if not frequencies:
-            continue
+@njit(cache=True)
+def _detect_long_tones_nb(first_freqs, candidates, excluded_frequencies, exclusion_tolerance):
+    """
+    Drops candidate long tones matching an excluded frequency. excluded_frequencies must be sorted. Returns the
+    remaining group indices.
+    """
+    indexes = np.empty(candidates.shape[0], dtype=np.int64)
+    found = 0
 
-        current_frequency = frequencies[0]
+    for i in candidates:
+        # Skip the frequency if it matches one of the excluded frequencies
+        if not _is_excluded(first_freqs[i], excluded_frequencies, exclusion_tolerance):
+            indexes[found] = i
+            found += 1
 
-        # Skip the loop iteration if the current frequency is in the excluded frequencies
-        if current_frequency in excluded_frequencies or current_frequency <= 500:
-            continue
+    return indexes[:found]
 
-        # Check if the duration meets the minimum requirement
-        if duration >= min_duration:
-            tone_data = {
-                "tone_id": f"lt_{len(long_tone_matches) + 1}",
-                "detected": current_frequency,
-                "start": start,
-                "end": end,
-                "length": duration
-            }
-            long_tone_matches.append(tone_data)
+
+def detect_long_tones(frequency_matches, detected_quickcall, min_duration=2.0, exclusion_tolerance=0.02,
+                      group_arrays=None):
+    long_tone_matches = []
+    if not frequency_matches:
+        return long_tone_matches
+
+    # Exclude the detected quick call tones. STFT peaks rarely repeat exactly, so frequencies are matched within
+    # exclusion_tolerance rather than by float equality.
+    excluded_frequencies = np.sort(np.fromiter(
+        (frequency for quickcall in detected_quickcall for frequency in quickcall["detected"][:2]),
+        dtype=np.float64))
+
+    if group_arrays is None:
+        group_arrays = frequency_matches_to_arrays(frequency_matches)
+    _, _, lengths, first_freqs, _, group_lens = group_arrays
+
+    # Long tones must be above 500 Hz and last at least min_duration
+    candidates = np.flatnonzero((group_lens > 0) & (first_freqs > 500) & (lengths >= min_duration))
+    indexes = _detect_long_tones_nb(first_freqs, candidates, excluded_frequencies, exclusion_tolerance)
+
+    for index in indexes.tolist():
+        start, end, duration, frequencies = frequency_matches[index]
+        long_tone_matches.append({
+            "tone_id": f"lt_{len(long_tone_matches) + 1}",
+            "detected": float(frequencies[0]),
+            "start": start,
+            "end": end,
+            "length": duration
+        })
 
     return long_tone_matches
 
@@ -80,7 +138,74 @@ def within_tolerance(frequency1, frequency2, tolerance=0.02):
     return abs(frequency1 - frequency2) / frequency1 <= tolerance
 
 
-def detect_warble_tones(frequency_matches, interval_length, min_alternations):
+# Warble scan states
+_WARBLE_SEEK = 0  # No sequence started
+_WARBLE_HAVE_ONE = 1  # Sequence holds a single tone
+_WARBLE_ALTERNATING = 2  # Sequence alternates between two tones
+
+
+@njit(cache=True)
+def _detect_warble_tones_nb(starts, ends, first_freqs, candidates, interval_length, min_alternations):
+    """
+    Scans the candidate groups for alternating warble tones in a single forward pass. Returns the first group index,
+    last group index, the two alternating frequencies and the alternation count of each sequence.
+    """
+    count = candidates.shape[0]
+    first_indexes = np.empty(count, dtype=np.int64)
+    last_indexes = np.empty(count, dtype=np.int64)
+    tones_a = np.empty(count, dtype=np.float64)
+    tones_b = np.empty(count, dtype=np.float64)
+    alternations = np.empty(count, dtype=np.int64)
+    found = 0
+
+    state = _WARBLE_SEEK
+    first_index = -1
+    last_index = -1
+    sequence_length = 0
+    tone_a = 0.0
+    tone_b = 0.0
+
+    # One extra step past the last candidate flushes the final sequence
+    for position in range(count + 1):
+        i = candidates[position] if position < count else -1
+        if i >= 0:
+            freq = first_freqs[i]
+            if state != _WARBLE_SEEK:
+                # The new frequency must differ from the previous one and be within the time interval limit
+                alternates = freq != first_freqs[last_index] and starts[i] - ends[last_index] <= interval_length
+                if alternates and state == _WARBLE_HAVE_ONE:
+                    tone_b = freq
+                    state = _WARBLE_ALTERNATING
+                    last_index = i
+                    sequence_length += 1
+                    continue
+                if alternates and (freq == tone_a or freq == tone_b):
+                    last_index = i
+                    sequence_length += 1
+                    continue
+
+        # The sequence ended: keep it if it alternated between exactly two tones often enough
+        if state == _WARBLE_ALTERNATING and sequence_length >= min_alternations:
+            first_indexes[found] = first_index
+            last_indexes[found] = last_index
+            tones_a[found] = tone_a
+            tones_b[found] = tone_b
+            alternations[found] = sequence_length
+            found += 1
+
+        if i >= 0:
+            # Start a new sequence with the current group
+            state = _WARBLE_HAVE_ONE
+            first_index = i
+            last_index = i
+            sequence_length = 1
+            tone_a = first_freqs[i]
+
+    return (first_indexes[:found], last_indexes[:found], tones_a[:found], tones_b[:found],
+            alternations[:found])
+
+
+def detect_warble_tones(frequency_matches, interval_length, min_alternations, group_arrays=None):
     """
     Extract sequences of alternating warble tones from a list of frequency matches.
 
@@ -88,67 +213,36 @@ def detect_warble_tones(frequency_matches, interval_length, min_alternations):
     - frequency_matches: A list of tuples, each containing start time, end time, and a list of frequencies.
     - interval_length: The maximum allowed interval in seconds between consecutive tones.
     - min_alternations: The minimum number of alternations for a sequence to be considered valid.
+    - group_arrays: Optional result of frequency_matches_to_arrays for frequency_matches, to avoid rebuilding it.
 
     Returns:
     - A list of dictionaries, each representing a detected sequence of warble tones with its details.
     """
     sequences = []
-    id_index = 1
-
-    i = 0
-    while i < len(frequency_matches):
-        current_sequence = []
-        current_tones = []
-
-        while i < len(frequency_matches):
-            group = frequency_matches[i]
-            if not group[3] or group[3][0] <= 0 or len(group[3]) < 2:
-                i += 1
-                continue
-
-            freq = group[3][0]
-
-            if not current_sequence:
-                # Start a new sequence with the current group
-                current_sequence.append(group)
-                current_tones.append(freq)
-            else:
-                last_group = current_sequence[-1]
-                last_freq = last_group[3][0]
-
-                # Check that the new frequency alternates with the previous one
-                # and it's within the time interval limit
-                if freq != last_freq and group[0] - last_group[1] <= interval_length:
-                    if len(current_tones) < 2:
-                        # If we have less than 2 tones, add the new tone
-                        current_tones.append(freq)
-                    if freq in current_tones:
-                        # Add to sequence if it continues the alternation pattern
-                        current_sequence.append(group)
-                    else:
-                        # Break the sequence if a new, third tone is introduced
-                        break
-                else:
-                    # Break the sequence if the same frequency repeats or interval exceeded
-                    break
-
-            i += 1
-
-        # Check if the current sequence is valid before proceeding
-        if len(current_sequence) >= min_alternations:
-            if len(current_tones) == 2:  # Ensure exactly two tones are alternating
-                sequences.append({
-                    "tone_id": f"hl_{id_index}",
-                    "detected": list(current_tones),
-                    "start": current_sequence[0][0],
-                    "end": current_sequence[-1][1],
-                    "length": round(current_sequence[-1][1] - current_sequence[0][0], 2),
-                    "alternations": len(current_sequence)
-                })
-                id_index += 1
-
-        # Move to the next possible sequence start
-        if i < len(frequency_matches) and not current_sequence:
-            i += 1  # Increment only if no sequence was started to avoid getting stuck
+    if not frequency_matches:
+        return sequences
+
+    if group_arrays is None:
+        group_arrays = frequency_matches_to_arrays(frequency_matches)
+    starts, ends, _, first_freqs, _, group_lens = group_arrays
+
+    # Only groups with a non-zero frequency held for at least two frames take part in a sequence
+    candidates = np.flatnonzero((group_lens >= 2) & (first_freqs > 0))
+    first_indexes, last_indexes, tones_a, tones_b, alternations = _detect_warble_tones_nb(
+        starts, ends, first_freqs, candidates, interval_length, min_alternations)
+
+    for id_index, (first_index, last_index, tone_a, tone_b, alternation_count) in enumerate(
+            zip(first_indexes.tolist(), last_indexes.tolist(), tones_a.tolist(), tones_b.tolist(),
+                alternations.tolist()), start=1):
+        start = frequency_matches[first_index][0]
+        end = frequency_matches[last_index][1]
+        sequences.append({
+            "tone_id": f"hl_{id_index}",
+            "detected": [tone_a, tone_b],
+            "start": start,
+            "end": end,
+            "length": round(end - start, 2),
+            "alternations": alternation_count
+        })
 
     return sequences
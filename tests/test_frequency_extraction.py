@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from icad_tone_detection import frequency_extraction
+from icad_tone_detection.frequency_extraction import FrequencyExtraction
+
+FRAME_RATE = 22050
+
+
+def tone(frequency, seconds):
+    t = np.arange(int(seconds * FRAME_RATE)) / FRAME_RATE
+    return 0.5 * np.sin(2 * np.pi * frequency * t)
+
+
+@pytest.mark.parametrize("numba", [True, False])
+def test_silent_frames_have_no_frequency_with_a_band(monkeypatch, numba):
+    # Digital silence after a tone must read as 0 Hz, not as a tone at the bottom of the frequency band
+    if not numba:
+        monkeypatch.setattr(frequency_extraction, "NUMBA_AVAILABLE", False)
+    elif not frequency_extraction.NUMBA_AVAILABLE:
+        pytest.skip("numba is not installed")
+
+    samples = np.concatenate([tone(1000, 2), np.zeros(5 * FRAME_RATE)])
+    groups = FrequencyExtraction(samples, FRAME_RATE, 7, 2.5, 25, frequency_band=(600, 3000)).get_audio_frequencies()
+
+    assert [group.freqs[0] for group in groups] == [pytest.approx(1001.3, abs=1), 0.0]
+
+
+def test_silent_audio_has_no_frequency_with_a_band():
+    samples = np.zeros(5 * FRAME_RATE)
+    groups = FrequencyExtraction(samples, FRAME_RATE, 5, 2.5, 25, frequency_band=(600, 3000)).get_audio_frequencies()
+
+    assert [group.freqs[0] for group in groups] == [0.0]